@@ -1,3 +1,4 @@
-from .aot import aot
-
-__all__ = ["aot"]
+from .aot import aot, aot_bulk
+from .piler import aligned
+
+__all__ = ["aot", "aot_bulk", "aligned"]
@@ -1,45 +1,165 @@
-from .piler import transpile_to_asm
-import subprocess
-import sys
-import shutil
-from pathlib import Path
-import urllib.request
-import zipfile
-
-NASM_URLS = {
-    "win32": "https://www.nasm.us/pub/nasm/releasebuilds/3.01rc9/win32/nasm-3.01rc9-win32.zip",
-    "win64": "https://www.nasm.us/pub/nasm/releasebuilds/3.01rc9/win64/nasm-3.01rc9-win64.zip"
-}
-
-NASM_CACHE = Path(".caesium_nasm")
-NASM_CACHE.mkdir(exist_ok=True)
-
-def download_nasm():
-    import platform
-    arch = platform.architecture()[0]
-    key = "win64" if arch == "64bit" else "win32"
-    url = NASM_URLS[key]
-    zip_path = NASM_CACHE / "nasm.zip"
-    if not zip_path.exists():
-        print("[aot] Downloading NASM...")
-        urllib.request.urlretrieve(url, zip_path)
-        with zipfile.ZipFile(zip_path, "r") as zf:
-            zf.extractall(NASM_CACHE)
-
-    # Recursively search for nasm.exe
-    for path in NASM_CACHE.rglob("nasm.exe"):
-        return path
-
-    raise FileNotFoundError("Could not find nasm.exe after extraction!")
-
-def aot(func):
-    """
-    Decorator to compile a Python math function to NASM and execute.
-    """
-    def wrapper(*args, **kwargs):
-        asm_file = transpile_to_asm(func)
-        nasm_exe = download_nasm()
-        bin_file = asm_file.with_suffix(".exe")
-        subprocess.run([str(nasm_exe), "-f", "win64", str(asm_file), "-o", str(bin_file)], check=True)
-        return bin_file
-    return wrapper
+from .piler import generate_asm_source, write_asm
+from .jit import compile_ir_object, load_ir_object
+from .loader import assemble, load_machine_code
+import subprocess
+import sys
+import shutil
+import functools
+import hashlib
+import inspect
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+# Resolved NASM executable; set on first use so later calls skip the lookup
+_nasm_exe = None
+
+def find_nasm():
+    """Return the path to the NASM executable on PATH."""
+    global _nasm_exe
+    if _nasm_exe is None:
+        found = shutil.which("nasm")
+        if found is None:
+            raise FileNotFoundError("The nasm backend needs NASM on PATH: https://www.nasm.us")
+        _nasm_exe = Path(found)
+    return _nasm_exe
+
+BACKENDS = ("llvm", "keystone", "nasm")
+
+# Compiled callables keyed by a digest of (backend, options, source)
+_CACHE = {}
+# Compile errors keyed like _CACHE; raised only when that function is called
+_FAILED = {}
+# Decorated functions not compiled yet; aot_bulk() with no arguments compiles them
+_pending = []
+
+def cache_key(func, backend, **options):
+    src = inspect.getsource(func)
+    return hashlib.blake2b(f"{backend}\0{sorted(options.items())}\0{src}".encode()).digest()
+
+def wrapper_key(wrapper):
+    """The cache key of an @aot wrapper, computed on first use.
+
+    Functions defined in a REPL or exec() have no source, so reading it is
+    deferred until the function is compiled instead of when it is decorated.
+    """
+    if wrapper.__caesium_key__ is None:
+        func, backend, options = wrapper.__caesium_spec__
+        wrapper.__caesium_key__ = cache_key(func, backend, **options)
+    return wrapper.__caesium_key__
+
+def compile_artifact(src, backend, promised=None, avx=False, unroll=1, fma=None):
+    """Compile a function's source to a picklable artifact; runs in worker processes."""
+    if backend == "llvm":
+        return compile_ir_object(src)
+    gen = generate_asm_source(src, promised, avx=avx, unroll=unroll, fma=fma)
+    if backend == "keystone":
+        return assemble(gen.source()), gen.arg_kinds
+    asm_file = write_asm(gen)
+    nasm_exe = find_nasm()
+    obj_file = asm_file.with_suffix(".obj")
+    subprocess.run([str(nasm_exe), "-O3", "-f", "win64", str(asm_file), "-o", str(obj_file)], check=True)
+    return obj_file
+
+def load_artifact(artifact, backend):
+    """Turn a compile_artifact() result into a callable in this process."""
+    if backend == "llvm":
+        return load_ir_object(*artifact)
+    if backend == "keystone":
+        return load_machine_code(*artifact)
+    return lambda *args, **kwargs: artifact
+
+def store_artifact(key, backend, get_artifact):
+    """Cache the callable for key, or record why it could not be built."""
+    try:
+        _CACHE[key] = load_artifact(get_artifact(), backend)
+    except Exception as e:
+        _FAILED[key] = e
+
+def aot_bulk(funcs=None, max_workers=None):
+    """
+    Compile several functions at once, fanning out across worker processes.
+
+    Accepts plain functions (compiled with the default backend) or @aot
+    wrappers, by default every decorated function not compiled yet; fills
+    the cache and returns the wrappers in order. A function that fails to
+    compile raises its error when it is called, not here.
+
+    Under the spawn start method (the default on Windows and macOS) the
+    workers re-import ``__main__``, so call this from behind an
+    ``if __name__ == "__main__":`` guard. ``max_workers=1`` compiles
+    in-process instead.
+    """
+    if funcs is None:
+        funcs = list(_pending)
+    wrappers = [f if hasattr(f, "__caesium_spec__") else aot(f) for f in funcs]
+    jobs = {}
+    no_source = []
+    for wrapper in wrappers:
+        func, backend, options = wrapper.__caesium_spec__
+        try:
+            key = wrapper_key(wrapper)
+        except OSError:
+            # Nothing to compile; calling the wrapper raises the error
+            no_source.append(wrapper)
+            continue
+        if key not in _CACHE and key not in _FAILED and key not in jobs:
+            promised = getattr(func, "__caesium_aligned__", None)
+            jobs[key] = (inspect.getsource(func), backend, promised, options)
+
+    if len(jobs) == 1 or max_workers == 1:
+        # Not worth a process pool
+        for key, (src, backend, promised, options) in jobs.items():
+            store_artifact(key, backend, lambda: compile_artifact(src, backend, promised, **options))
+    elif jobs:
+        workers = min(len(jobs), max_workers or os.cpu_count() or 1)
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {
+                key: pool.submit(compile_artifact, src, backend, promised, **options)
+                for key, (src, backend, promised, options) in jobs.items()
+            }
+            # One failed job must not discard the others' finished artifacts
+            for key, future in futures.items():
+                store_artifact(key, jobs[key][1], future.result)
+    _pending[:] = [w for w in _pending if w not in no_source
+                   and w.__caesium_key__ not in _CACHE and w.__caesium_key__ not in _FAILED]
+    return wrappers
+
+def aot(func=None, *, backend="llvm", avx=False, unroll=1, fma=None):
+    """
+    Decorator to compile a Python math function to native code.
+
+    The default ``llvm`` backend JIT-compiles through llvmlite and calls the
+    result. ``backend="keystone"`` assembles the generated listing in memory
+    and calls it (SysV x86-64 only: Linux, macOS); ``backend="nasm"`` writes
+    it out as a win64 object file.
+    For the assembly backends, ``avx`` selects 4-wide AVX over 2-wide SSE2
+    array loops, ``unroll`` interleaves that many vector bodies and ``fma``
+    forces fused multiply-add on or off (default: detect from the CPU).
+
+    Compilation is deferred to the first call, which compiles just that
+    function in-process; call aot_bulk() up front to compile every pending
+    function in parallel instead.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend {backend!r}, expected one of {BACKENDS}")
+    if func is None:
+        return lambda f: aot(f, backend=backend, avx=avx, unroll=unroll, fma=fma)
+    options = {"avx": avx, "unroll": unroll, "fma": fma}
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        key = wrapper_key(wrapper)
+        compiled = _CACHE.get(key)
+        if compiled is None:
+            # Never start a pool implicitly: spawned workers would re-run an
+            # unguarded script's top level
+            aot_bulk([wrapper], max_workers=1)
+            if key in _FAILED:
+                raise _FAILED[key]
+            compiled = _CACHE[key]
+        return compiled(*args, **kwargs)
+    wrapper.__caesium_spec__ = (func, backend, options)
+    wrapper.__caesium_key__ = None
+    _pending.append(wrapper)
+    return wrapper
@@ -0,0 +1,240 @@
+import ast
+import ctypes
+
+import llvmlite.binding as llvm
+from llvmlite import ir
+
+# -----------------------------
+# LLVM setup
+# -----------------------------
+DOUBLE = ir.DoubleType()
+INT64 = ir.IntType(64)
+
+_initialized = False
+
+def create_target_machine():
+    """Return a fresh native TargetMachine, initializing LLVM on first use.
+
+    MCJIT takes ownership of the TargetMachine it is given, so every engine
+    needs its own.
+    """
+    global _initialized
+    if not _initialized:
+        llvm.initialize_native_target()
+        llvm.initialize_native_asmprinter()
+        _initialized = True
+    target = llvm.Target.from_default_triple()
+    # Artifacts only ever run on the machine that built them, so target its
+    # CPU: without this LLVM assumes baseline x86-64 (SSE2, no AVX/FMA)
+    return target.create_target_machine(cpu=llvm.get_host_cpu_name(),
+                                        features=llvm.get_host_cpu_features().flatten(), opt=3)
+
+# -----------------------------
+# IR Generator
+# -----------------------------
+class IRGenerator(ast.NodeVisitor):
+    """Lowers a Python math function to an LLVM IR module of doubles."""
+    def __init__(self, func_name, args):
+        self.func_name = func_name
+        self.args = args
+        self.module = ir.Module(name=func_name)
+        self.module.triple = llvm.get_process_triple()
+        fnty = ir.FunctionType(DOUBLE, [DOUBLE] * len(args))
+        self.function = ir.Function(self.module, fnty, name=func_name)
+        for arg, name in zip(self.function.args, args):
+            arg.name = name
+        self.builder = None
+        self.locals = {}
+        self.inductions = {}
+        self.loop_count = 0
+
+    # -----------------------------
+    # Statements
+    # -----------------------------
+    def visit_FunctionDef(self, node):
+        entry = self.function.append_basic_block("entry")
+        self.builder = ir.IRBuilder(entry)
+        # Parameters live in stack slots like any other local, so reassigning
+        # one inside a loop is seen by the next iteration; mem2reg removes them
+        for arg, name in zip(self.function.args, self.args):
+            self.builder.store(arg, self.local_slot(name))
+        for stmt in node.body:
+            self.visit(stmt)
+        if not self.builder.block.is_terminated:
+            self.builder.ret(ir.Constant(DOUBLE, 0.0))
+
+    def visit_Return(self, node):
+        self.builder.ret(self.visit(node.value))
+
+    def visit_Assign(self, node):
+        value = self.visit(node.value)
+        for target in node.targets:
+            self.builder.store(value, self.local_slot(self.target_name(target)))
+
+    def visit_AugAssign(self, node):
+        slot = self.local_slot(self.target_name(node.target))
+        current = self.visit(ast.Name(id=node.target.id, ctx=ast.Load()))
+        self.builder.store(self.binop(node.op, current, self.visit(node.value)), slot)
+
+    def visit_For(self, node):
+        self.loop_count += 1
+        loop_id = self.loop_count
+        if not (isinstance(node.iter, ast.Call) and getattr(node.iter.func, "id", None) == "range"):
+            raise NotImplementedError("Only range() loops are supported")
+        start, stop, step = self.range_bounds(node.iter.args)
+
+        preheader = self.builder.block
+        header = self.function.append_basic_block(f"loop_{loop_id}.header")
+        body = self.function.append_basic_block(f"loop_{loop_id}.body")
+        latch = self.function.append_basic_block(f"loop_{loop_id}.latch")
+        exit_block = self.function.append_basic_block(f"loop_{loop_id}.exit")
+        self.builder.branch(header)
+
+        # Header: SSA induction variable
+        self.builder.position_at_end(header)
+        ivar = self.builder.phi(INT64, name=node.target.id)
+        ivar.add_incoming(start, preheader)
+        cond = self.builder.icmp_signed("<" if step > 0 else ">", ivar, stop)
+        self.builder.cbranch(cond, body, exit_block)
+
+        # Body
+        self.builder.position_at_end(body)
+        self.inductions[node.target.id] = ivar
+        for stmt in node.body:
+            self.visit(stmt)
+        del self.inductions[node.target.id]
+        if not self.builder.block.is_terminated:
+            self.builder.branch(latch)
+
+        # Latch
+        self.builder.position_at_end(latch)
+        ivar.add_incoming(self.builder.add(ivar, ir.Constant(INT64, step)), latch)
+        self.builder.branch(header)
+
+        self.builder.position_at_end(exit_block)
+
+    # -----------------------------
+    # Expressions
+    # -----------------------------
+    def visit_BinOp(self, node):
+        return self.binop(node.op, self.visit(node.left), self.visit(node.right))
+
+    def visit_Name(self, node):
+        if node.id in self.inductions:
+            return self.builder.sitofp(self.inductions[node.id], DOUBLE)
+        if node.id not in self.locals:
+            raise NotImplementedError(f"Name {node.id!r} is not defined here")
+        return self.builder.load(self.locals[node.id], name=node.id)
+
+    def visit_UnaryOp(self, node):
+        operand = self.visit(node.operand)
+        if isinstance(node.op, ast.USub):
+            return self.builder.fneg(operand)
+        elif isinstance(node.op, ast.UAdd):
+            return operand
+        else:
+            raise NotImplementedError(f"Operator {type(node.op)} not supported")
+
+    def visit_Constant(self, node):
+        return ir.Constant(DOUBLE, float(node.value))
+
+    def generic_visit(self, node):
+        raise NotImplementedError(f"Node {type(node)} not supported")
+
+    def binop(self, op, left, right):
+        if isinstance(op, ast.Add):
+            return self.builder.fadd(left, right)
+        elif isinstance(op, ast.Sub):
+            return self.builder.fsub(left, right)
+        elif isinstance(op, ast.Mult):
+            return self.builder.fmul(left, right)
+        elif isinstance(op, ast.Div):
+            return self.builder.fdiv(left, right)
+        else:
+            raise NotImplementedError(f"Operator {type(op)} not supported")
+
+    # -----------------------------
+    # Helpers
+    # -----------------------------
+    def local_slot(self, name):
+        """Return the stack slot for a local; mem2reg promotes it to SSA."""
+        if name not in self.locals:
+            entry = self.function.entry_basic_block
+            with self.builder.goto_block(entry):
+                if entry.instructions:
+                    self.builder.position_before(entry.instructions[0])
+                self.locals[name] = self.builder.alloca(DOUBLE, name=name)
+        return self.locals[name]
+
+    def target_name(self, target):
+        if not isinstance(target, ast.Name):
+            raise NotImplementedError(f"Assignment to {type(target)} not supported")
+        return target.id
+
+    def range_bounds(self, args):
+        """Return (start, stop, step) of a range() call; step must be a nonzero literal."""
+        if not 1 <= len(args) <= 3:
+            raise NotImplementedError("range() takes 1 to 3 arguments")
+        step = 1
+        if len(args) == 3:
+            try:
+                step = ast.literal_eval(args[2])
+            except ValueError:
+                step = None
+            if not isinstance(step, int) or not step:
+                raise NotImplementedError("range() step must be a nonzero integer literal")
+        if len(args) == 1:
+            return ir.Constant(INT64, 0), self.trip_count(args[0]), step
+        return self.trip_count(args[0]), self.trip_count(args[1]), step
+
+    def trip_count(self, node):
+        if isinstance(node, ast.Constant):
+            return ir.Constant(INT64, int(node.value))
+        return self.builder.fptosi(self.visit(node), INT64)
+
+# -----------------------------
+# Optimize + JIT
+# -----------------------------
+def optimize(llmod, tm, opt_level=3):
+    """Run LLVM's O3 pipeline with the loop and SLP vectorizers enabled."""
+    pto = llvm.create_pipeline_tuning_options(speed_level=opt_level)
+    pto.loop_vectorization = True
+    pto.slp_vectorization = True
+    pb = llvm.create_pass_builder(tm, pto)
+    pb.getModulePassManager().run(llmod, pb)
+    return llmod
+
+def lower(src):
+    """Parse, lower and optimize src; return (llmod, tm, func_name, nargs)."""
+    tree = ast.parse(src)
+    func_node = tree.body[0]
+    func_name = func_node.name
+    args = [arg.arg for arg in func_node.args.args]
+
+    gen = IRGenerator(func_name, args)
+    gen.visit(func_node)
+
+    tm = create_target_machine()
+    llmod = llvm.parse_assembly(str(gen.module))
+    llmod.verify()
+    optimize(llmod, tm)
+    return llmod, tm, func_name, len(args)
+
+def wrap_engine(engine, func_name, nargs):
+    addr = engine.get_function_address(func_name)
+    cfunc = ctypes.CFUNCTYPE(ctypes.c_double, *[ctypes.c_double] * nargs)(addr)
+    # The engine owns the machine code; keep it alive as long as the callable
+    cfunc.engine = engine
+    return cfunc
+
+def compile_ir_object(src):
+    """Compile source to a picklable (object code, func_name, nargs) artifact."""
+    llmod, tm, func_name, nargs = lower(src)
+    return tm.emit_object(llmod), func_name, nargs
+
+def load_ir_object(obj, func_name, nargs):
+    """Link an object from compile_ir_object into a fresh engine and wrap it."""
+    engine = llvm.create_mcjit_compiler(llvm.parse_assembly(""), create_target_machine())
+    engine.add_object_file(llvm.ObjectFileRef.from_data(obj))
+    engine.finalize_object()
+    return wrap_engine(engine, func_name, nargs)
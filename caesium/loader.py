@@ -0,0 +1,88 @@
+import ctypes
+import mmap
+import re
+import struct
+import sys
+
+# -----------------------------
+# In-memory assembly
+# -----------------------------
+# NASM-only lines keystone does not understand
+_DIRECTIVES = ("section", "global")
+_SECTION_ALIGN = re.compile(r"\balign=(\d+)")
+_DATA_QWORD = re.compile(r"^(\w+:)?\s*dq\s+")
+
+def nasm_to_keystone(source):
+    """Rewrite the NASM listing into the Intel syntax keystone assembles.
+
+    Sections are flattened into one buffer, so a section's alignment becomes
+    an .align directive and data follows the code it belongs to.
+    """
+    lines = []
+    for line in source.splitlines():
+        line = line.split(";", 1)[0].strip()
+        if not line:
+            continue
+        if line.startswith(_DIRECTIVES):
+            align_match = _SECTION_ALIGN.search(line)
+            if align_match:
+                lines.append(f".align {align_match.group(1)}")
+            continue
+        line = line.replace("[rel ", "[rip + ")
+        line = _DATA_QWORD.sub(lambda m: f"{m.group(1) or ''} .quad ", line)
+        lines.append(line)
+    return "\n".join(lines)
+
+def assemble(source):
+    """Assemble NASM-style x86-64 source to machine code with keystone."""
+    try:
+        import keystone
+    except ImportError as e:
+        raise ImportError("The keystone backend needs keystone-engine: pip install keystone-engine") from e
+    ks = keystone.Ks(keystone.KS_ARCH_X86, keystone.KS_MODE_64)
+    encoding, _ = ks.asm(nasm_to_keystone(source))
+    return bytes(encoding)
+
+# -----------------------------
+# Executable memory
+# -----------------------------
+def executable_buffer(code):
+    """Copy machine code into an executable mmap; return (address, owner)."""
+    buf = mmap.mmap(-1, len(code), prot=mmap.PROT_READ | mmap.PROT_WRITE | mmap.PROT_EXEC)
+    buf.write(code)
+    addr = ctypes.addressof(ctypes.c_char.from_buffer(buf))
+    return addr, buf
+
+# -----------------------------
+# Calling convention
+# -----------------------------
+ARG_CTYPES = {"array": ctypes.c_void_p, "int": ctypes.c_int64, "double": ctypes.c_uint64}
+
+def convert_arg(kind, value):
+    """Marshal a Python value into the integer register the generated code reads."""
+    if kind == "double":
+        # Doubles arrive as raw bits in a general-purpose register (movq xmm, reg)
+        return struct.unpack("<Q", struct.pack("<d", value))[0]
+    if kind == "array":
+        if isinstance(value, int):
+            return value
+        return ctypes.addressof(ctypes.c_char.from_buffer(value))
+    return int(value)
+
+def load_machine_code(code, arg_kinds):
+    """Wrap machine code in a Python callable taking the original arguments."""
+    if sys.platform == "win32":
+        # The generator reads SysV argument registers and clobbers xmm6-15,
+        # which the Windows x64 convention requires callees to preserve
+        raise NotImplementedError("Calling generated code needs the SysV x86-64 ABI, not Windows x64")
+    addr, owner = executable_buffer(code)
+    kinds = list(arg_kinds.values())
+    cfunc = ctypes.CFUNCTYPE(ctypes.c_double, *[ARG_CTYPES[k] for k in kinds])(addr)
+
+    def call(*args):
+        if len(args) != len(kinds):
+            raise TypeError(f"expected {len(kinds)} arguments, got {len(args)}")
+        return cfunc(*[convert_arg(k, v) for k, v in zip(kinds, args)])
+    # Keep the executable mapping alive as long as the callable
+    call.buffer = owner
+    return call
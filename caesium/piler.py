@@ -1,175 +1,920 @@
-import inspect
-import ast
-from pathlib import Path
-import struct
-
-# -----------------------------
-# Utilities
-# -----------------------------
-def align(value, alignment):
-    """Align a value to the given power-of-2 alignment."""
-    return (value + (alignment - 1)) & ~(alignment - 1)
-
-def float_to_hex(f):
-    """Convert Python float to 64-bit hex for assembly."""
-    return hex(struct.unpack("<Q", struct.pack("<d", f))[0])
-
-def chunk_list(lst, n):
-    """Yield successive n-sized chunks from list."""
-    for i in range(0, len(lst), n):
-        yield lst[i:i + n]
-
-# -----------------------------
-# Registers
-# -----------------------------
-XMM_REGS = ["xmm{}".format(i) for i in range(16)]
-GENERAL_REGS = ["rdi","rsi","rdx","rcx","r8","r9"]
-
-class RegisterAllocator:
-    """Tracks used XMM registers."""
-    def __init__(self):
-        self.free_xmm = XMM_REGS.copy()
-        self.used_xmm = {}
-    def allocate_xmm(self, name):
-        if name in self.used_xmm:
-            return self.used_xmm[name]
-        if not self.free_xmm:
-            raise RuntimeError("Ran out of XMM registers!")
-        reg = self.free_xmm.pop(0)
-        self.used_xmm[name] = reg
-        return reg
-    def free_all(self):
-        self.free_xmm = XMM_REGS.copy()
-        self.used_xmm.clear()
-
-# -----------------------------
-# ASM Generator
-# -----------------------------
-class ASMGenerator(ast.NodeVisitor):
-    def __init__(self, func_name, args):
-        self.func_name = func_name
-        self.args = args
-        self.lines = []
-        self.reg_alloc = RegisterAllocator()
-        self.loop_count = 0
-
-    # -----------------------------
-    # Function prologue / epilogue
-    # -----------------------------
-    def generate_prologue(self):
-        self.lines.append("section .text")
-        self.lines.append(f"global {self.func_name}")
-        self.lines.append(f"{self.func_name}:")
-        self.lines.append("    ; Function prologue")
-        self.lines.append("    push rbp")
-        self.lines.append("    mov rbp, rsp")
-        self.lines.append("    ; Assume float args in rdi, rsi, rdx, rcx, r8, r9")
-
-    def generate_epilogue(self):
-        self.lines.append("    ; Function epilogue")
-        self.lines.append("    pop rbp")
-        self.lines.append("    ret")
-
-    # -----------------------------
-    # Node visitors
-    # -----------------------------
-    def visit_FunctionDef(self, node):
-        self.generate_prologue()
-        for stmt in node.body:
-            self.visit(stmt)
-        self.generate_epilogue()
-
-    def visit_Return(self, node):
-        self.visit(node.value)
-        # Result expected in xmm0
-
-    def visit_BinOp(self, node):
-        left = self.evaluate_node(node.left)
-        right = self.evaluate_node(node.right)
-        op_line = self.binop_to_asm(node.op, left, right)
-        self.lines.append(op_line)
-
-    def visit_Name(self, node):
-        idx = self.args.index(node.id)
-        reg = GENERAL_REGS[idx]
-        xmm = self.reg_alloc.allocate_xmm(node.id)
-        self.lines.append(f"    movq {xmm}, {reg}    ; Load argument {node.id}")
-        return xmm
-
-    def visit_Constant(self, node):
-        xmm = self.reg_alloc.allocate_xmm(f"const_{node.value}")
-        hexval = float_to_hex(node.value)
-        self.lines.append(f"    mov rax, {hexval}    ; Load constant {node.value}")
-        self.lines.append(f"    movq {xmm}, rax")
-        return xmm
-
-    def binop_to_asm(self, op, left, right):
-        if isinstance(op, ast.Add):
-            return f"    addsd {left}, {right}    ; add"
-        elif isinstance(op, ast.Sub):
-            return f"    subsd {left}, {right}    ; sub"
-        elif isinstance(op, ast.Mult):
-            return f"    mulsd {left}, {right}    ; mul"
-        elif isinstance(op, ast.Div):
-            return f"    divsd {left}, {right}    ; div"
-        else:
-            raise NotImplementedError(f"Operator {type(op)} not supported")
-
-    # -----------------------------
-    # Loops for array vectorization
-    # -----------------------------
-    def visit_For(self, node):
-        self.loop_count += 1
-        loop_id = self.loop_count
-        self.lines.append(f"    ; Begin loop {loop_id}")
-        # Assume for i in range(n)
-        target = node.target.id
-        if isinstance(node.iter, ast.Call) and node.iter.func.id == "range":
-            range_arg = node.iter.args[0]
-            if isinstance(range_arg, ast.Name):
-                n_var = range_arg.id
-            elif isinstance(range_arg, ast.Constant):
-                n_var = range_arg.value
-            else:
-                n_var = "n"
-            self.lines.append(f"    mov rcx, {n_var}    ; loop counter")
-            self.lines.append(f"loop_{loop_id}:")
-            for stmt in node.body:
-                self.visit(stmt)
-            self.lines.append(f"    dec rcx")
-            self.lines.append(f"    jnz loop_{loop_id}")
-        self.lines.append(f"    ; End loop {loop_id}")
-
-    # -----------------------------
-    # Evaluate nodes recursively
-    # -----------------------------
-    def evaluate_node(self, node):
-        if isinstance(node, ast.BinOp):
-            self.visit_BinOp(node)
-            return self.reg_alloc.allocate_xmm("tmp")
-        elif isinstance(node, ast.Name):
-            return self.visit_Name(node)
-        elif isinstance(node, ast.Constant):
-            return self.visit_Constant(node)
-        else:
-            raise NotImplementedError(f"Node {type(node)} not supported")
-
-# -----------------------------
-# Main transpile API
-# -----------------------------
-def transpile_to_asm(func):
-    src = inspect.getsource(func)
-    tree = ast.parse(src)
-    func_node = tree.body[0]
-    func_name = func_node.name
-    args = [arg.arg for arg in func_node.args.args]
-
-    gen = ASMGenerator(func_name, args)
-    gen.visit(func_node)
-
-    asm_file = Path(f"./{func_name}.asm")
-    with open(asm_file, "w") as f:
-        f.write("\n".join(gen.lines))
-
-    print(f"[piler] Generated assembly for {func_name} -> {asm_file}")
-    return asm_file
\ No newline at end of file
+import inspect
+import ast
+import functools
+import heapq
+import io
+import math
+import operator
+from pathlib import Path
+import struct
+
+# -----------------------------
+# Utilities
+# -----------------------------
+def align(value, alignment):
+    """Align a value to the given power-of-2 alignment."""
+    return (value + (alignment - 1)) & ~(alignment - 1)
+
+@functools.lru_cache(maxsize=1024)
+def _float_to_hex(f, negative):
+    return f"0x{struct.unpack('<Q', struct.pack('<d', f))[0]:016x}"
+
+def float_to_hex(f):
+    """Convert Python float to 64-bit hex for assembly."""
+    # 0.0 == -0.0 would share a cache entry; keying on the sign keeps them apart
+    return _float_to_hex(f, math.copysign(1.0, f) < 0)
+
+# Pre-seed the cache with the literals most numeric code uses
+for _k in (0.0, 1.0, -1.0, 0.5, 2.0, math.pi, math.e, math.inf):
+    float_to_hex(_k)
+del _k
+
+def detect_fma():
+    """True when the CPU supports FMA3 (Haswell and later)."""
+    try:
+        from cpufeature import CPUFeature
+    except ImportError:
+        return False
+    return bool(CPUFeature.get("FMA3"))
+
+def fma_operands(node):
+    """Match `a*b + c` or `c + a*b` and return (a, b, c), else None."""
+    if not (isinstance(node, ast.BinOp) and isinstance(node.op, ast.Add)):
+        return None
+    if isinstance(node.left, ast.BinOp) and isinstance(node.left.op, ast.Mult):
+        return node.left.left, node.left.right, node.right
+    if isinstance(node.right, ast.BinOp) and isinstance(node.right.op, ast.Mult):
+        return node.right.left, node.right.right, node.left
+    return None
+
+def chunk_list(lst, n):
+    """Yield successive n-sized chunks from list."""
+    for i in range(0, len(lst), n):
+        yield lst[i:i + n]
+
+# -----------------------------
+# Registers
+# -----------------------------
+XMM_REGS = ["xmm{}".format(i) for i in range(16)]
+GENERAL_REGS = ["rdi","rsi","rdx","rcx","r8","r9"]
+INDEX_REG = "r10"    # element index for array loops
+COUNT_REG = "r11"    # vector iteration counter (rcx may hold an argument)
+SPILL_SLOT_SIZE = 32  # wide enough for a ymm register
+
+BINOP_MNEMONICS = {ast.Add: "add", ast.Sub: "sub", ast.Mult: "mul", ast.Div: "div"}
+COMMUTATIVE_OPS = (ast.Add, ast.Mult)
+HOIST_LIMIT = 8      # loop invariants kept resident, out of 16 XMM registers
+SCALAR_UNROLL = 4    # copies per iteration of a loop that cannot be vectorized
+FULL_UNROLL_MAX = 8  # constant trip counts up to this are unrolled completely
+LOOP_WEIGHT = 10     # a use one loop deeper counts as this many uses outside it
+
+class RegisterAllocator:
+    """Linear-scan XMM allocator over the live ranges computed by LivenessPass."""
+    def __init__(self, liveness, spill=None):
+        self.liveness = liveness
+        self.spill = spill        # callback(reg, slot) emitting the spill store
+        self.free_xmm = XMM_REGS.copy()
+        self.used_xmm = {}        # value node -> reg
+        self.owner = {}           # reg -> value node
+        self.active = []          # min-heap of (last_use_idx, seq, reg)
+        self.generation = {}      # reg -> seq of its current binding
+        self.seq = 0
+        self.spilled = {}         # value node -> spill slot
+        self.pinned = set()       # value nodes that must never be spilled
+        self.free_slots = []
+        self.num_slots = 0
+        self.now = 0
+    def allocate_xmm(self, node, exclude=()):
+        self.expire(self.now)
+        if not self.free_xmm:
+            self.evict(exclude)
+        reg = self.free_xmm.pop(0)
+        self.bind(node, reg)
+        return reg
+    def bind(self, node, reg):
+        self.seq += 1
+        self.used_xmm[node] = reg
+        self.owner[reg] = node
+        self.generation[reg] = self.seq
+        last_use = self.liveness.last_use.get(node, self.now)
+        heapq.heappush(self.active, (last_use, self.seq, reg))
+    def transfer(self, src, dst):
+        """Hand src's register to dst (two-operand ops overwrite their left input)."""
+        reg = self.used_xmm.pop(src)
+        self.bind(dst, reg)
+        return reg
+    def expire(self, idx):
+        """Free every register whose value was last used before idx."""
+        while self.active and self.active[0][0] < idx:
+            _, seq, reg = heapq.heappop(self.active)
+            if self.generation.get(reg) == seq:
+                self.release(reg)
+    def release(self, reg):
+        node = self.owner.pop(reg)
+        del self.used_xmm[node]
+        del self.generation[reg]
+        self.free_xmm.append(reg)
+        self.free_xmm.sort(key=XMM_REGS.index)
+    def evict(self, exclude=()):
+        """Spill the cheapest live value: lowest use weight, then furthest last use."""
+        candidates = [node for node in self.used_xmm
+                      if node not in exclude and node not in self.pinned]
+        if not candidates:
+            raise RuntimeError("Ran out of XMM registers!")
+        victim = min(candidates, key=lambda node: (self.liveness.weight.get(node, 1),
+                                                   -self.liveness.last_use.get(node, 0)))
+        reg = self.used_xmm[victim]
+        if self.free_slots:
+            slot = self.free_slots.pop()
+        else:
+            self.num_slots += 1
+            slot = self.num_slots
+        self.spill(reg, slot)
+        self.release(reg)
+        self.spilled[victim] = slot
+    def free_all(self):
+        self.free_xmm = XMM_REGS.copy()
+        self.used_xmm.clear()
+        self.owner.clear()
+        self.active.clear()
+        self.generation.clear()
+        self.spilled.clear()
+        self.pinned.clear()
+
+# -----------------------------
+# Constant folding
+# -----------------------------
+FOLD_OPS = {ast.Add: operator.add, ast.Sub: operator.sub, ast.Mult: operator.mul, ast.Div: operator.truediv}
+FOLD_UNARY_OPS = {ast.USub: operator.neg, ast.UAdd: operator.pos}
+
+def eval_op(op, left, right):
+    return float(FOLD_OPS[type(op)](left, right))
+
+def is_const(node, value=None):
+    if not isinstance(node, ast.Constant) or isinstance(node.value, bool):
+        return False
+    return value is None or node.value == value
+
+class ConstFolder(ast.NodeTransformer):
+    """Folds constant sub-expressions and removes algebraic identities.
+
+    Like -ffast-math, x*0 and x-x fold to 0.0 without regard for NaN/inf.
+    """
+    def visit_UnaryOp(self, node):
+        # -1.5 parses as USub applied to 1.5; make it a plain literal
+        self.generic_visit(node)
+        if type(node.op) in FOLD_UNARY_OPS and is_const(node.operand):
+            value = FOLD_UNARY_OPS[type(node.op)](node.operand.value)
+            return ast.copy_location(ast.Constant(value), node)
+        return node
+
+    def visit_BinOp(self, node):
+        self.generic_visit(node)
+        left, right, op = node.left, node.right, node.op
+        if type(op) not in FOLD_OPS:
+            return node
+        if is_const(left) and is_const(right):
+            try:
+                return ast.copy_location(ast.Constant(eval_op(op, left.value, right.value)), node)
+            except ZeroDivisionError:
+                return node
+        if isinstance(op, ast.Mult):
+            if is_const(right, 1):
+                return left
+            if is_const(left, 1):
+                return right
+            if is_const(right, 0) or is_const(left, 0):
+                return ast.copy_location(ast.Constant(0.0), node)
+        elif isinstance(op, ast.Add):
+            if is_const(right, 0):
+                return left
+            if is_const(left, 0):
+                return right
+        elif isinstance(op, ast.Sub):
+            if is_const(right, 0):
+                return left
+            if ast.dump(left) == ast.dump(right):
+                return ast.copy_location(ast.Constant(0.0), node)
+        elif isinstance(op, ast.Div):
+            if is_const(right, 1):
+                return left
+        return node
+
+# -----------------------------
+# Liveness
+# -----------------------------
+class LivenessPass(ast.NodeVisitor):
+    """Numbers nodes in emission order and records each value's live range."""
+    def __init__(self, fuse_fma=False):
+        self.fuse_fma = fuse_fma
+        self.index = {}       # node -> SSA index
+        self.last_use = {}    # value node -> index of its last consumer
+        self.weight = {}      # value node -> spill cost, sum(10**loop_depth) over its uses
+        self.counter = 0
+        self.loop_depth = 0
+
+    def number(self, node, *operands):
+        idx = self.counter
+        self.counter += 1
+        self.index[node] = idx
+        for operand in operands:
+            self.last_use[operand] = idx
+            self.weight[operand] = self.weight.get(operand, 0) + LOOP_WEIGHT ** self.loop_depth
+        return idx
+
+    def visit_FunctionDef(self, node):
+        for stmt in node.body:
+            self.visit(stmt)
+        self.number(node)
+
+    def visit_For(self, node):
+        self.loop_depth += 1
+        for stmt in node.body:
+            self.visit(stmt)
+        self.loop_depth -= 1
+        self.number(node)
+
+    def visit_Return(self, node):
+        self.visit(node.value)
+        self.number(node, node.value)
+
+    def visit_Assign(self, node):
+        self.visit(node.value)
+        self.number(node, node.value)
+
+    def visit_BinOp(self, node):
+        fused = fma_operands(node) if self.fuse_fma else None
+        if fused:
+            # Mirrors ASMGenerator.emit_fma: the multiply is never materialized
+            for operand in fused:
+                self.visit(operand)
+            self.number(node, *fused)
+            return
+        self.visit(node.left)
+        self.visit(node.right)
+        self.number(node, node.left, node.right)
+
+    def visit_Name(self, node):
+        self.number(node)
+
+    def visit_Constant(self, node):
+        self.number(node)
+
+    def visit_Subscript(self, node):
+        self.number(node)
+
+    def generic_visit(self, node):
+        raise NotImplementedError(f"Node {type(node)} not supported")
+
+# -----------------------------
+# ASM Generator
+# -----------------------------
+class ASMGenerator(ast.NodeVisitor):
+    def __init__(self, func_name, args, avx=False, unroll=1, fma=None, trip_count_hint=True,
+                 alignment=None):
+        if unroll < 1 or unroll & (unroll - 1):
+            raise ValueError(f"unroll must be a power of 2, got {unroll}")
+        self.func_name = func_name
+        self.args = args
+        self._out = io.StringIO()
+        # Fuse a*b + c into one FMA; autodetected from cpuid unless forced
+        self.has_fma = detect_fma() if fma is None else fma
+        self.liveness = LivenessPass(fuse_fma=self.has_fma)
+        self.reg_alloc = RegisterAllocator(self.liveness, spill=self.spill_xmm)
+        self.loop_count = 0
+        # Packed-double lowering: 2 lanes with SSE2, 4 with AVX
+        self.avx = avx
+        self.vector_width = 4 if avx else 2
+        self.unroll = unroll
+        # Specialize loops whose range() bound is a literal
+        self.trip_count_hint = trip_count_hint
+        self.packed = False
+        self.has_simd = False
+        # Byte alignment promised for array arguments, see aligned()
+        self.alignment = alignment or {}
+        self.index_regs = {}
+        self.disp = 0
+        self.arg_kinds = {}
+        # Loop-invariant value nodes materialized in a loop preheader -> reg
+        self.hoisted = {}
+        # Unique literals by bit pattern (keeps 0.0 and -0.0 apart) -> label
+        self.const_pool = {}
+        # Precomputed type -> method tables; NodeVisitor.visit builds the
+        # method name and does a getattr for every node.
+        self._expr_dispatch = {
+            ast.BinOp: self.visit_BinOp,
+            ast.Name: self.visit_Name,
+            ast.Constant: self.visit_Constant,
+            ast.Subscript: self.visit_Subscript,
+        }
+        self._dispatch = {
+            **self._expr_dispatch,
+            ast.Return: self.visit_Return,
+            ast.Assign: self.visit_Assign,
+            ast.For: self.visit_For,
+            ast.FunctionDef: self.visit_FunctionDef,
+        }
+
+    def visit(self, node):
+        return self._dispatch.get(type(node), self.generic_visit)(node)
+
+    def emit(self, line):
+        self._out.write(line)
+        self._out.write("\n")
+
+    def source(self):
+        """The generated NASM listing."""
+        return self._out.getvalue()
+
+    # -----------------------------
+    # Function prologue / epilogue
+    # -----------------------------
+    def generate_prologue(self):
+        self.emit("section .text")
+        self.emit(f"global {self.func_name}")
+        self.emit(f"{self.func_name}:")
+        self.emit("    ; Function prologue")
+        self.emit("    push rbp")
+        self.emit("    mov rbp, rsp")
+        if self.frame_size:
+            self.emit(f"    sub rsp, {self.frame_size}    ; spill slots")
+            if self.has_simd:
+                # Slots are rsp-relative, so this makes packed spills aligned
+                self.emit(f"    and rsp, -{self.simd_bytes}")
+        self.emit("    ; Assume float args in rdi, rsi, rdx, rcx, r8, r9")
+
+    def generate_epilogue(self):
+        self.emit("    ; Function epilogue")
+        if self.frame_size:
+            self.emit("    mov rsp, rbp")
+        self.emit("    pop rbp")
+        self.emit("    ret")
+
+    def emit_rodata(self):
+        """Constant pool: each literal stored twice so SSE2 can movapd a broadcast."""
+        if not self.const_pool:
+            return
+        # win64 COFF only knows .rdata; an unknown name would land in an executable section
+        self.emit("section .rdata rdata align=16")
+        for hexval, label in self.const_pool.items():
+            self.emit(f"{label}: dq {hexval}, {hexval}")
+
+    # -----------------------------
+    # Node visitors
+    # -----------------------------
+    def visit_FunctionDef(self, node):
+        self.arg_kinds = classify_args(node)
+        self.liveness.visit(node)
+        # Emit the body first: the prologue needs the final spill frame size
+        for stmt in node.body:
+            self.visit(stmt)
+        body, self._out = self._out, io.StringIO()
+        self.generate_prologue()
+        self._out.write(body.getvalue())
+        self.generate_epilogue()
+        self.emit_rodata()
+
+    def visit_Return(self, node):
+        self.evaluate_node(node.value)
+        xmm = self.operand(node.value)
+        # Result expected in xmm0
+        if xmm != "xmm0":
+            self.emit(f"    movapd xmm0, {xmm}")
+
+    def visit_BinOp(self, node):
+        fused = fma_operands(node) if self.has_fma else None
+        if fused:
+            return self.emit_fma(node, *fused)
+        self.evaluate_node(node.left)
+        self.evaluate_node(node.right)
+        self.reg_alloc.now = self.liveness.index[node]
+        lhs, rhs = node.left, node.right
+        if lhs in self.hoisted and rhs not in self.hoisted and isinstance(node.op, COMMUTATIVE_OPS):
+            lhs, rhs = rhs, lhs
+        left = self.operand(lhs, exclude=(rhs,))
+        right = self.operand(rhs, exclude=(lhs,))
+        left = self.writable(lhs, left, node, exclude=(rhs,))
+        reg, op_line = self.binop_to_asm(node.op, left, right)
+        self.emit(op_line)
+        return reg
+
+    def emit_fma(self, node, a, b, c):
+        """Lower a*b + c to vfmadd231: c += a*b with a single rounding."""
+        for operand in (a, b, c):
+            self.evaluate_node(operand)
+        self.reg_alloc.now = self.liveness.index[node]
+        xmm_c = self.operand(c, exclude=(a, b))
+        xmm_a = self.operand(a, exclude=(b, c))
+        xmm_b = self.operand(b, exclude=(a, c))
+        xmm_c = self.writable(c, xmm_c, node, exclude=(a, b))
+        suffix = "pd" if self.packed else "sd"
+        self.emit(f"    vfmadd231{suffix} {self.vreg(xmm_c)}, {self.vreg(xmm_a)}, {self.vreg(xmm_b)}    ; c += a*b")
+        return xmm_c
+
+    def writable(self, src, xmm, node, exclude=()):
+        """Register the result of node may overwrite, currently holding src's value.
+
+        Normally src dies here and node takes over its register; hoisted
+        invariants are reused every iteration, so they get copied instead.
+        """
+        if src not in self.hoisted:
+            self.reg_alloc.transfer(src, node)
+            return xmm
+        dst = self.reg_alloc.allocate_xmm(node, exclude=(src, *exclude))
+        mov = "vmovapd" if self.packed and self.avx else "movapd"
+        self.emit(f"    {mov} {self.vreg(dst)}, {self.vreg(xmm)}    ; copy invariant")
+        return dst
+
+    def visit_Name(self, node):
+        if node.id in self.index_regs:
+            return self.load_induction(node)
+        idx = self.args.index(node.id)
+        reg = GENERAL_REGS[idx]
+        xmm = self.reg_alloc.allocate_xmm(node)
+        if self.arg_kinds.get(node.id) == "int":
+            # Range bounds are passed as int64, not as the bits of a double
+            convert = f"vcvtsi2sd {xmm}, {xmm}, {reg}" if self.vex else f"cvtsi2sd {xmm}, {reg}"
+            self.emit(f"    {convert}    ; Convert argument {node.id}")
+        else:
+            self.emit(f"    {self.vex}movq {xmm}, {reg}    ; Load argument {node.id}")
+        self.broadcast(xmm)
+        return xmm
+
+    def load_induction(self, node):
+        """Convert the loop variable (plus the unrolled copy's offset) to a double."""
+        xmm = self.reg_alloc.allocate_xmm(node)
+        index = self.index_regs[node.id]
+        offset = self.disp // 8
+        if offset:
+            self.emit(f"    lea rax, [{index}+{offset}]")
+            index = "rax"
+        self.emit(f"    cvtsi2sd {xmm}, {index}    ; Load {node.id}")
+        return xmm
+
+    def visit_Constant(self, node):
+        xmm = self.reg_alloc.allocate_xmm(node)
+        addr = f"[rel {self.const_label(node.value)}]"
+        if self.packed and self.avx:
+            self.emit(f"    vbroadcastsd {self.ymm(xmm)}, {addr}    ; Load constant {node.value}")
+            return xmm
+        if self.packed:
+            self.emit(f"    movapd {xmm}, {addr}    ; Load constant {node.value}")
+            return xmm
+        self.emit(f"    movsd {xmm}, {addr}    ; Load constant {node.value}")
+        return xmm
+
+    def const_label(self, value):
+        hexval = float_to_hex(float(value))
+        if hexval not in self.const_pool:
+            self.const_pool[hexval] = f"const_{len(self.const_pool)}"
+        return self.const_pool[hexval]
+
+    def visit_Subscript(self, node):
+        xmm = self.reg_alloc.allocate_xmm(node)
+        addr = self.element_address(node)
+        self.emit(f"    {self.array_move_op(node.value.id)} {self.vreg(xmm)}, {addr}    ; Load {node.value.id}[]")
+        return xmm
+
+    def visit_Assign(self, node):
+        target = node.targets[0]
+        if len(node.targets) != 1 or not isinstance(target, ast.Subscript):
+            raise NotImplementedError("Only array element assignment is supported")
+        self.evaluate_node(node.value)
+        xmm = self.operand(node.value)
+        addr = self.element_address(target)
+        self.emit(f"    {self.array_move_op(target.value.id)} {addr}, {self.vreg(xmm)}    ; Store {target.value.id}[]")
+
+    def binop_to_asm(self, op, left, right):
+        """Return (result_reg, line); the result lands in the left register."""
+        base = BINOP_MNEMONICS.get(type(op))
+        if base is None:
+            raise NotImplementedError(f"Operator {type(op)} not supported")
+        if not self.packed:
+            return left, f"    {base}sd {left}, {right}    ; {base}"
+        if self.avx:
+            l, r = self.ymm(left), self.ymm(right)
+            return left, f"    v{base}pd {l}, {l}, {r}    ; packed {base}"
+        return left, f"    {base}pd {left}, {right}    ; packed {base}"
+
+    # -----------------------------
+    # Spilling
+    # -----------------------------
+    @property
+    def frame_size(self):
+        return SPILL_SLOT_SIZE * self.reg_alloc.num_slots
+
+    def slot_address(self, slot):
+        offset = SPILL_SLOT_SIZE * (slot - 1)
+        return f"[rsp+{offset}]" if offset else "[rsp]"
+
+    def spill_xmm(self, reg, slot):
+        self.emit(f"    {self.aligned_move_op} {self.slot_address(slot)}, {self.vreg(reg)}    ; spill")
+
+    def operand(self, node, exclude=()):
+        """Register holding node's value, reloading it if it was spilled."""
+        if node in self.hoisted:
+            return self.hoisted[node]
+        slot = self.reg_alloc.spilled.pop(node, None)
+        if slot is None:
+            return self.reg_alloc.used_xmm[node]
+        xmm = self.reg_alloc.allocate_xmm(node, exclude)
+        self.emit(f"    {self.aligned_move_op} {self.vreg(xmm)}, {self.slot_address(slot)}    ; reload")
+        self.reg_alloc.free_slots.append(slot)
+        return xmm
+
+    # -----------------------------
+    # Packed-double helpers
+    # -----------------------------
+    @property
+    def vex(self):
+        """Mnemonic prefix: VEX-encode inside AVX loops to avoid SSE/AVX transitions."""
+        return "v" if self.packed and self.avx else ""
+
+    @property
+    def simd_bytes(self):
+        return 8 * self.vector_width
+
+    @property
+    def move_op(self):
+        """Full-width unaligned move for the current lowering mode."""
+        if not self.packed:
+            return "movsd"
+        return "vmovupd" if self.avx else "movupd"
+
+    @property
+    def aligned_move_op(self):
+        """Full-width move for operands known to be vector-aligned."""
+        if not self.packed:
+            return "movsd"
+        return "vmovapd" if self.avx else "movapd"
+
+    def array_move_op(self, name):
+        """Aligned moves only for arrays declared with @aligned; others may be unaligned."""
+        if self.alignment.get(name, 8) >= self.simd_bytes:
+            return self.aligned_move_op
+        return self.move_op
+
+    def ymm(self, xmm):
+        return xmm.replace("xmm", "ymm")
+
+    def vreg(self, xmm):
+        """Register name covering every lane in the current lowering mode."""
+        return self.ymm(xmm) if self.packed and self.avx else xmm
+
+    def broadcast(self, xmm):
+        """Splat the low double of xmm across every lane of the vector."""
+        if not self.packed:
+            return
+        if self.avx:
+            self.emit(f"    vmovddup {xmm}, {xmm}")
+            self.emit(f"    vinsertf128 {self.ymm(xmm)}, {self.ymm(xmm)}, {xmm}, 1")
+        else:
+            self.emit(f"    unpcklpd {xmm}, {xmm}")
+
+    def element_address(self, node):
+        if not (isinstance(node.value, ast.Name) and isinstance(node.slice, ast.Name)):
+            raise NotImplementedError("Only arr[i] subscripts are supported")
+        base = GENERAL_REGS[self.args.index(node.value.id)]
+        index = self.index_regs[node.slice.id]
+        if self.disp:
+            return f"[{base}+{index}*8+{self.disp}]"
+        return f"[{base}+{index}*8]"
+
+    def int_operand(self, node):
+        """Register or immediate holding an integer trip count."""
+        if isinstance(node, ast.Constant):
+            return str(int(node.value))
+        return GENERAL_REGS[self.args.index(node.id)]
+
+    # -----------------------------
+    # Loops for array vectorization
+    # -----------------------------
+    def visit_For(self, node):
+        self.loop_count += 1
+        loop_id = self.loop_count
+        if not (isinstance(node.iter, ast.Call) and getattr(node.iter.func, "id", None) == "range"
+                and len(node.iter.args) == 1):
+            raise NotImplementedError("Only range(n) loops are supported")
+        # Every loop counts in INDEX_REG/COUNT_REG, so an inner loop would clobber the outer one
+        if any(isinstance(inner, ast.For) for stmt in node.body for inner in ast.walk(stmt)):
+            raise NotImplementedError("Nested loops are not supported")
+        # visit_Return only sets xmm0; there is no jump out of the loop body
+        if any(isinstance(inner, ast.Return) for stmt in node.body for inner in ast.walk(stmt)):
+            raise NotImplementedError("return inside a loop is not supported")
+        self.emit(f"    ; Begin loop {loop_id}")
+        range_arg = node.iter.args[0]
+        static = self.static_trip_count(range_arg)
+        if isinstance(range_arg, ast.Constant) and range_arg.value <= 0:
+            self.emit("    ; Empty range, loop elided")
+        elif static is not None and static <= FULL_UNROLL_MAX:
+            self.emit_unrolled_loop(node, static)
+        else:
+            self.guard_trip_count(range_arg, loop_id)
+            if self.is_pointwise(node):
+                self.emit_vector_loop(node, loop_id, range_arg)
+            else:
+                self.emit_scalar_loop(node, loop_id, range_arg)
+            self.emit(f"loop_{loop_id}_end:")
+        self.emit(f"    ; End loop {loop_id}")
+
+    def static_trip_count(self, range_arg):
+        """The trip count when it is a literal and loops may be specialized on it."""
+        if self.trip_count_hint and isinstance(range_arg, ast.Constant):
+            return int(range_arg.value)
+        return None
+
+    def guard_trip_count(self, range_arg, loop_id):
+        """Skip the loop when a runtime trip count is zero or negative."""
+        if isinstance(range_arg, ast.Constant):
+            return
+        count = self.int_operand(range_arg)
+        self.emit(f"    test {count}, {count}")
+        self.emit(f"    jle loop_{loop_id}_end")
+
+    def emit_body_copies(self, node, copies, stride, start=0):
+        """Emit copies of the loop body, copy k addressing element index+start+k*stride."""
+        body_end = self.liveness.index[node.body[-1]] + 1
+        for k in range(copies):
+            self.disp = (start + k * stride) * 8
+            for stmt in node.body:
+                self.visit(stmt)
+            # Every value of this copy is dead before the next one starts
+            self.reg_alloc.expire(body_end)
+        self.disp = 0
+
+    def emit_unrolled_loop(self, node, count):
+        """Fully unroll a loop with a small constant trip count: no branches at all."""
+        vector = count >= self.vector_width and self.is_pointwise(node)
+        self.index_regs[node.target.id] = INDEX_REG
+        self.emit(f"    ; Fully unrolled: {count} iterations")
+        if vector:
+            self.packed = self.has_simd = True
+        hoisted = self._hoist_invariants(node, node.target.id)
+        self.emit(f"    xor {INDEX_REG}, {INDEX_REG}    ; element index")
+        self.emit_straight_line(node, count, vector)
+        self._drop_invariants(hoisted)
+        del self.index_regs[node.target.id]
+
+    def emit_straight_line(self, node, count, vector):
+        """Branch-free body copies for count elements from the current index.
+
+        With vector set, whole vectors go packed and only the rest is scalar.
+        """
+        wide = count // self.vector_width if vector else 0
+        if wide:
+            self.packed = True
+            self.emit_body_copies(node, wide, self.vector_width)
+        self.packed = False
+        if vector and self.avx:
+            self.emit("    vzeroupper")
+        self.emit_body_copies(node, count - wide * self.vector_width, 1,
+                              start=wide * self.vector_width)
+
+    def emit_scalar_loop(self, node, loop_id, range_arg):
+        """Count r10 up over [base + r10*8], unrolled 4x, with a scalar cleanup loop.
+
+        With a constant trip count the bound is an immediate and the
+        cleanup is emitted straight-line.
+        """
+        count = self.int_operand(range_arg)
+        static = self.static_trip_count(range_arg)
+        self.index_regs[node.target.id] = INDEX_REG
+        self.emit(f"    ; Scalar loop: unroll={SCALAR_UNROLL}")
+        hoisted = self._hoist_invariants(node, node.target.id)
+        self.emit(f"    xor {INDEX_REG}, {INDEX_REG}    ; element index")
+        if static is None:
+            bound = limit = COUNT_REG
+            self.emit(f"    mov {COUNT_REG}, {count}")
+            self.emit(f"    and {COUNT_REG}, -{SCALAR_UNROLL}    ; bound of the unrolled loop")
+            self.emit(f"    jz loop_{loop_id}_tail")
+        else:
+            bound = limit = static & -SCALAR_UNROLL
+            if bound >= 2 ** 31:
+                # cmp only takes a sign-extended imm32
+                self.emit(f"    mov {COUNT_REG}, {bound}    ; bound of the unrolled loop")
+                limit = COUNT_REG
+        if bound:
+            self.emit(f"loop_{loop_id}:")
+            self.emit_body_copies(node, SCALAR_UNROLL, 1)
+            self.emit(f"    add {INDEX_REG}, {SCALAR_UNROLL}")
+            self.emit(f"    cmp {INDEX_REG}, {limit}")
+            self.emit(f"    jb loop_{loop_id}")
+        if static is None:
+            self.emit_scalar_tail(node, loop_id, count)
+        else:
+            self.emit_straight_line(node, static - bound, vector=False)
+        self._drop_invariants(hoisted)
+        del self.index_regs[node.target.id]
+
+    def emit_scalar_tail(self, node, loop_id, count):
+        """One element per iteration for the n % step leftover elements."""
+        self.emit(f"loop_{loop_id}_tail:")
+        self.emit(f"    cmp {INDEX_REG}, {count}")
+        self.emit(f"    jae loop_{loop_id}_end")
+        self.emit(f"loop_{loop_id}_scalar:")
+        for stmt in node.body:
+            self.visit(stmt)
+        self.emit(f"    inc {INDEX_REG}")
+        self.emit(f"    cmp {INDEX_REG}, {count}")
+        self.emit(f"    jb loop_{loop_id}_scalar")
+
+    def is_pointwise(self, node):
+        """Match `for i in range(n): out[i] = f(a[i], b[i], scalars...)`."""
+        loop_var = node.target.id
+
+        def indexed(sub):
+            return (isinstance(sub.value, ast.Name) and isinstance(sub.slice, ast.Name)
+                    and sub.slice.id == loop_var)
+
+        def pointwise(expr):
+            if isinstance(expr, ast.BinOp):
+                return type(expr.op) in BINOP_MNEMONICS and pointwise(expr.left) and pointwise(expr.right)
+            if isinstance(expr, ast.Subscript):
+                return indexed(expr)
+            if isinstance(expr, ast.Name):
+                return expr.id != loop_var and expr.id in self.args
+            return isinstance(expr, ast.Constant)
+
+        return bool(node.body) and all(
+            isinstance(stmt, ast.Assign) and len(stmt.targets) == 1
+            and isinstance(stmt.targets[0], ast.Subscript) and indexed(stmt.targets[0])
+            and pointwise(stmt.value)
+            for stmt in node.body
+        )
+
+    def emit_vector_loop(self, node, loop_id, range_arg):
+        """Lower a pointwise loop to packed ops, unrolled, with a scalar tail.
+
+        A constant trip count is split at compile time: n // step loop
+        iterations, then the leftovers straight-line, packed where a whole
+        vector remains, so n % VW == 0 needs no scalar code at all.
+        """
+        vw = self.vector_width
+        step = vw * self.unroll
+        count = self.int_operand(range_arg)
+        static = self.static_trip_count(range_arg)
+        self.index_regs[node.target.id] = INDEX_REG
+        self.emit(f"    ; Packed loop: VW={vw}, unroll={self.unroll}")
+        self.packed = True
+        self.has_simd = True
+        # Broadcast invariants once; their low lane also serves the scalar tail
+        hoisted = self._hoist_invariants(node, node.target.id)
+        if static is None:
+            iterations = None
+            self.emit(f"    mov {COUNT_REG}, {count}    ; trip count")
+            self.emit(f"    xor {INDEX_REG}, {INDEX_REG}    ; element index")
+            self.emit(f"    shr {COUNT_REG}, {step.bit_length() - 1}    ; vector iterations")
+            self.emit(f"    jz loop_{loop_id}_tail")
+        else:
+            iterations, rest = divmod(static, step)
+            self.emit(f"    xor {INDEX_REG}, {INDEX_REG}    ; element index")
+            if iterations:
+                self.emit(f"    mov {COUNT_REG}, {iterations}    ; vector iterations")
+        if iterations != 0:
+            self.emit(f"loop_{loop_id}:")
+            # Interleave independent copies of the body at increasing displacements
+            self.emit_body_copies(node, self.unroll, vw)
+            self.emit(f"    add {INDEX_REG}, {step}")
+            self.emit(f"    dec {COUNT_REG}")
+            self.emit(f"    jnz loop_{loop_id}")
+        if static is None:
+            self.packed = False
+            if self.avx:
+                self.emit("    vzeroupper")
+            self.emit_scalar_tail(node, loop_id, count)
+        else:
+            self.emit_straight_line(node, rest, vector=True)
+        self._drop_invariants(hoisted)
+        del self.index_regs[node.target.id]
+
+    # -----------------------------
+    # Loop-invariant code motion
+    # -----------------------------
+    def _hoist_invariants(self, node, loop_var):
+        """Materialize the HOIST_LIMIT hottest constants and scalar arguments before the loop.
+
+        Returns the hoisted nodes so the caller can release them once the loop is done.
+        """
+        loop_end = self.liveness.index[node]
+        groups = {}
+        for stmt in node.body:
+            if not isinstance(stmt, (ast.Assign, ast.Return)):
+                continue
+            for value in invariant_values(stmt.value, loop_var):
+                if isinstance(value, ast.Constant):
+                    key = ("const", float_to_hex(float(value.value)))
+                else:
+                    key = ("name", value.id)
+                groups.setdefault(key, []).append(value)
+        weight = self.liveness.weight
+        # sorted() is stable: equal priorities keep source order
+        ranked = sorted(groups.values(), key=lambda g: -sum(weight.get(v, 1) for v in g))
+        hoisted = []
+        for leader, *copies in ranked[:HOIST_LIMIT]:
+            # Keep it live (and unspillable) until the loop exits
+            self.liveness.last_use[leader] = loop_end
+            self.hoisted[leader] = self.evaluate_node(leader)
+            self.reg_alloc.pinned.add(leader)
+            for value in copies:
+                self.hoisted[value] = self.hoisted[leader]
+            hoisted += [leader, *copies]
+        return hoisted
+
+    def _drop_invariants(self, hoisted):
+        for value in hoisted:
+            del self.hoisted[value]
+            self.reg_alloc.pinned.discard(value)
+
+    # -----------------------------
+    # Evaluate nodes recursively
+    # -----------------------------
+    def evaluate_node(self, node):
+        if node in self.hoisted:
+            return self.hoisted[node]
+        visitor = self._expr_dispatch.get(type(node))
+        if visitor is None:
+            raise NotImplementedError(f"Node {type(node)} not supported")
+        self.reg_alloc.now = self.liveness.index[node]
+        return visitor(node)
+
+def invariant_values(expr, loop_var):
+    """Yield the constants and scalar names inside expr that do not depend on loop_var."""
+    if isinstance(expr, ast.BinOp):
+        yield from invariant_values(expr.left, loop_var)
+        yield from invariant_values(expr.right, loop_var)
+    elif isinstance(expr, ast.Constant):
+        yield expr
+    elif isinstance(expr, ast.Name) and expr.id != loop_var:
+        yield expr
+
+def aligned(alignment, *names):
+    """Promise that array arguments (all, or just `names`) are `alignment`-byte aligned.
+
+    Packed loops then use movapd/vmovapd on them instead of movupd/vmovupd.
+    Misaligned data passed to such a function faults.
+    """
+    def decorate(func):
+        promised = dict(getattr(func, "__caesium_aligned__", {}))
+        promised.update({name: alignment for name in names} if names else {"*": alignment})
+        for target in (func, getattr(func, "__wrapped__", None)):
+            if target is not None:
+                target.__caesium_aligned__ = promised
+        return func
+    return decorate
+
+def array_alignment(promised, arg_kinds):
+    """Resolve aligned() promises to a {array argument: bytes} map."""
+    promised = promised or {}
+    default = promised.get("*", 8)
+    return {name: promised.get(name, default) for name, kind in arg_kinds.items() if kind == "array"}
+
+# -----------------------------
+# Argument classification
+# -----------------------------
+def classify_args(func_node):
+    """Map each argument to how it is passed: "array" pointer, "int" count or "double"."""
+    args = [arg.arg for arg in func_node.args.args]
+    kinds = dict.fromkeys(args, "double")
+    for node in ast.walk(func_node):
+        if isinstance(node, ast.Subscript) and isinstance(node.value, ast.Name):
+            if node.value.id in kinds:
+                kinds[node.value.id] = "array"
+        elif (isinstance(node, ast.For) and isinstance(node.iter, ast.Call)
+              and getattr(node.iter.func, "id", None) == "range"):
+            for bound in node.iter.args:
+                if isinstance(bound, ast.Name) and bound.id in kinds:
+                    kinds[bound.id] = "int"
+    return kinds
+
+# -----------------------------
+# Main transpile API
+# -----------------------------
+def generate_asm_source(src, promised=None, avx=False, unroll=1, fma=None):
+    """Run the generator over a function's source and return it, without touching the disk."""
+    tree = ast.parse(src)
+    tree = ConstFolder().visit(tree)
+    func_node = tree.body[0]
+    func_name = func_node.name
+    args = [arg.arg for arg in func_node.args.args]
+
+    alignment = array_alignment(promised, classify_args(func_node))
+    gen = ASMGenerator(func_name, args, avx=avx, unroll=unroll, fma=fma, alignment=alignment)
+    gen.visit(func_node)
+    return gen
+
+def generate_asm(func, avx=False, unroll=1, fma=None):
+    src = inspect.getsource(func)
+    promised = getattr(func, "__caesium_aligned__", None)
+    return generate_asm_source(src, promised, avx=avx, unroll=unroll, fma=fma)
+
+def write_asm(gen):
+    func_name = gen.func_name
+    asm_file = Path(f"./{func_name}.asm")
+    with open(asm_file, "w") as f:
+        f.write(gen.source())
+
+    print(f"[piler] Generated assembly for {func_name} -> {asm_file}")
+    return asm_file
+
+def transpile_to_asm(func, avx=False, unroll=1, fma=None):
+    return write_asm(generate_asm(func, avx=avx, unroll=unroll, fma=fma))
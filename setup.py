@@ -1,13 +1,14 @@
-from setuptools import setup, find_packages
-
-setup(
-    name="caesium",
-    version="0.1.0",
-    description="Python math AOT compiler with NASM SIMD assembly",
-    author="Intiha",
-    author_email="",
-    url="https://github.com/gund4422/caesium",
-    packages=find_packages(),
-    python_requires=">=3.9",
-    install_requires=[],
-)
+from setuptools import setup, find_packages
+
+setup(
+    name="caesium",
+    version="0.1.0",
+    description="Python math AOT compiler with LLVM and NASM SIMD backends",
+    author="Intiha",
+    author_email="",
+    url="https://github.com/gund4422/caesium",
+    packages=find_packages(),
+    python_requires=">=3.10",
+    install_requires=["llvmlite>=0.44"],
+    extras_require={"keystone": ["keystone-engine"], "fma": ["cpufeature"]},
+)
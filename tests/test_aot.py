@@ -0,0 +1,76 @@
+import pytest
+
+pytest.importorskip("llvmlite")
+
+import importlib
+
+from caesium import aot, aot_bulk
+
+aot_module = importlib.import_module("caesium.aot")
+
+def test_decorating_without_source():
+    # exec() leaves no source for inspect; only the call may fail on it
+    namespace = {"aot": aot}
+    exec("@aot\ndef double(x):\n    return x * 2.0\n", namespace)
+    with pytest.raises(OSError):
+        namespace["double"](1.0)
+
+# Defined at module level: compilation re-parses each function's source
+@aot
+def cached(x):
+    return x * 3.0
+
+@aot
+def bulk_a(x):
+    return x + 1.0
+
+@aot
+def bulk_b(x):
+    return x - 1.0
+
+@aot
+def branches(x):
+    if x:
+        return x
+    return 0.0
+
+@aot
+def pooled_a(x, y):
+    return x * y
+
+@aot
+def pooled_b(x, y):
+    return x / y
+
+@aot
+def pooled_bad(x):
+    while x:
+        x = x - 1.0
+    return x
+
+def test_second_call_hits_cache(monkeypatch):
+    assert cached(2.0) == 6.0
+    compiled = aot_module._CACHE[aot_module.wrapper_key(cached)]
+    monkeypatch.setattr(aot_module, "compile_artifact", None)
+    assert cached(4.0) == 12.0
+    assert aot_module._CACHE[aot_module.wrapper_key(cached)] is compiled
+
+def test_aot_bulk_drains_pending():
+    assert bulk_a in aot_module._pending and bulk_b in aot_module._pending
+    aot_bulk(max_workers=1)
+    assert bulk_a not in aot_module._pending and bulk_b not in aot_module._pending
+    assert aot_module.wrapper_key(bulk_a) in aot_module._CACHE
+    assert bulk_a(1.0) == 2.0 and bulk_b(1.0) == 0.0
+
+def test_compile_error_raised_on_call():
+    aot_bulk([branches, cached], max_workers=1)
+    assert cached(1.0) == 3.0
+    with pytest.raises(NotImplementedError):
+        branches(1.0)
+
+def test_pool_isolates_failures():
+    aot_bulk([pooled_a, pooled_b, pooled_bad], max_workers=2)
+    assert pooled_a(3.0, 2.0) == 6.0
+    assert pooled_b(3.0, 2.0) == 1.5
+    with pytest.raises(NotImplementedError):
+        pooled_bad(1.0)
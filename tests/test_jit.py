@@ -0,0 +1,51 @@
+import pytest
+
+pytest.importorskip("llvmlite")
+
+from caesium.jit import compile_ir_object, load_ir_object
+
+def compile_src(src):
+    return load_ir_object(*compile_ir_object(src))
+
+REASSIGN_PARAM = """
+def bump(x):
+    x += 1.0
+    return x
+"""
+
+REASSIGN_PARAM_IN_LOOP = """
+def double(x, n):
+    for i in range(n):
+        x = x * 2.0
+    return x
+"""
+
+def test_reassigned_parameter():
+    assert compile_src(REASSIGN_PARAM)(2.5) == 3.5
+
+def test_parameter_reassigned_in_loop():
+    assert compile_src(REASSIGN_PARAM_IN_LOOP)(1.5, 3) == 12.0
+
+NEGATIVE_LITERAL = """
+def scale(x):
+    return x * -2.0
+"""
+
+NEGATE = """
+def negate(a):
+    return -a
+"""
+
+def test_negative_literal():
+    assert compile_src(NEGATIVE_LITERAL)(1.5) == -3.0
+
+def test_negate():
+    assert compile_src(NEGATE)(2.5) == -2.5
+
+@pytest.mark.parametrize("src", [
+    "def f(a):\n    return a + b\n",
+    "def f(n):\n    for i in range(n):\n        x = 1.0\n    return i\n",
+])
+def test_undefined_name_rejected(src):
+    with pytest.raises(NotImplementedError, match="not defined"):
+        compile_src(src)
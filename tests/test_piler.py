@@ -0,0 +1,157 @@
+import array
+
+import pytest
+
+from caesium.piler import generate_asm_source
+
+NESTED = """
+def nested(out, x, n, m):
+    for i in range(n):
+        for j in range(m):
+            out[j] = out[j] + x[j]
+"""
+
+RANGE_START = """
+def shifted(out, x, n):
+    for i in range(1, n):
+        out[i] = x[i]
+"""
+
+RETURN_IN_LOOP = """
+def first(x, n):
+    for i in range(n):
+        return x[i] + i
+    return 0.0
+"""
+
+def test_return_in_loop_rejected():
+    # The loop would keep running and the final return overwrite xmm0
+    with pytest.raises(NotImplementedError, match="return inside a loop"):
+        generate_asm_source(RETURN_IN_LOOP)
+
+def test_nested_loops_rejected():
+    # Both loops would share r10/r11, so the inner one clobbers the outer
+    with pytest.raises(NotImplementedError, match="Nested"):
+        generate_asm_source(NESTED)
+
+def test_range_start_rejected():
+    with pytest.raises(NotImplementedError, match="range"):
+        generate_asm_source(RANGE_START)
+
+UNSUPPORTED = [
+    "def f(a):\n    return -a\n",
+    "def f(out, x, n):\n    for i in range(n):\n        out[i] += x[i]\n",
+    "def f(a):\n    if a:\n        return a\n    return a\n",
+]
+
+@pytest.mark.parametrize("src", UNSUPPORTED)
+def test_unsupported_node_rejected(src):
+    with pytest.raises(NotImplementedError, match="not supported"):
+        generate_asm_source(src)
+
+DIVIDE_BY_BOUND = """
+def scale(out, x, n):
+    for i in range(n):
+        out[i] = x[i] / n
+"""
+
+@pytest.mark.parametrize("avx", [False, True])
+def test_range_bound_read_as_value(avx):
+    pytest.importorskip("keystone")
+    from caesium.loader import assemble, load_machine_code
+    gen = generate_asm_source(DIVIDE_BY_BOUND, avx=avx)
+    scale = load_machine_code(assemble(gen.source()), gen.arg_kinds)
+    x = array.array("d", range(7))
+    out = array.array("d", [0.0] * 7)
+    scale(out, x, 7)
+    assert list(out) == [v / 7 for v in x]
+
+NEGATIVE_LITERAL = """
+def negate(out, x, n):
+    for i in range(n):
+        out[i] = x[i] * -2.0 + -0.5
+"""
+
+def test_negative_literal():
+    pytest.importorskip("keystone")
+    from caesium.loader import assemble, load_machine_code
+    gen = generate_asm_source(NEGATIVE_LITERAL)
+    negate = load_machine_code(assemble(gen.source()), gen.arg_kinds)
+    x = array.array("d", range(5))
+    out = array.array("d", [0.0] * 5)
+    negate(out, x, 5)
+    assert list(out) == [v * -2.0 + -0.5 for v in x]
+
+def test_huge_literal_bound():
+    pytest.importorskip("keystone")
+    from caesium.loader import assemble
+    # Too large for cmp's imm32; must be compared through a register
+    gen = generate_asm_source(
+        "def big(out, x):\n    for i in range(3000000001):\n        out[i] = x[i] + i\n")
+    assert assemble(gen.source())
+
+# -----------------------------
+# Loop lowering against Python
+# -----------------------------
+def cpu_flags():
+    try:
+        with open("/proc/cpuinfo") as f:
+            return {flag for line in f if line.startswith("flags") for flag in line.split()}
+    except OSError:
+        return set()
+
+# 0, 1, VW-1, step = VW*unroll, step+1, up to FULL_UNROLL_MAX and past it
+SIZES = [0, 1, 2, 3, 4, 5, 7, 8, 9, 13, 16, 17, 31]
+
+KERNELS = {
+    "pointwise": ("out[i] = x[i] - y[i] / 4.0", lambda x, y, a, i: x - y / 4.0),
+    "fma": ("out[i] = x[i] * y[i] + x[i]", lambda x, y, a, i: x * y + x),
+    "hoisted": ("out[i] = x[i] * a + 3.0 - a * y[i] + 0.5",
+                lambda x, y, a, i: x * a + 3.0 - a * y + 0.5),
+    "scalar": ("out[i] = x[i] + i * a - y[i]", lambda x, y, a, i: x + i * a - y),
+}
+
+def compile_kernel(body, bound, avx, unroll, fma):
+    from caesium.loader import assemble, load_machine_code
+    src = f"def kernel(out, x, y, a, n):\n    for i in range({bound}):\n        {body}\n"
+    gen = generate_asm_source(src, avx=avx, unroll=unroll, fma=fma)
+    return load_machine_code(assemble(gen.source()), gen.arg_kinds)
+
+@pytest.mark.parametrize("literal", [False, True], ids=["runtime_n", "literal_n"])
+@pytest.mark.parametrize("fma", [False, True], ids=["nofma", "fma"])
+@pytest.mark.parametrize("unroll", [1, 2, 4])
+@pytest.mark.parametrize("avx", [False, True], ids=["sse2", "avx"])
+@pytest.mark.parametrize("kernel", KERNELS)
+def test_loop_matches_python(kernel, avx, unroll, fma, literal):
+    pytest.importorskip("keystone")
+    flags = cpu_flags()
+    if avx and "avx" not in flags or fma and "fma" not in flags:
+        pytest.skip("CPU lacks the instructions under test")
+    body, reference = KERNELS[kernel]
+    if not literal:
+        compiled = compile_kernel(body, "n", avx, unroll, fma)
+    a = 1.25
+    for n in SIZES:
+        if literal:
+            compiled = compile_kernel(body, n, avx, unroll, fma)
+        x = array.array("d", [0.5 * k - 3.0 for k in range(n + 1)])
+        y = array.array("d", [7.0 - k / 3.0 for k in range(n + 1)])
+        # One extra element catches a loop that runs past n
+        out = array.array("d", [-99.0] * (n + 1))
+        compiled(out, x, y, a, n)
+        expected = [reference(x[i], y[i], a, i) for i in range(n)] + [-99.0]
+        assert list(out) == pytest.approx(expected), f"n={n}"
+
+def test_spilled_expression():
+    pytest.importorskip("keystone")
+    from caesium.loader import assemble, load_machine_code
+    # Right-nested, so every left operand stays live: more values than XMM registers
+    terms = [f"{name} * {k + 1}.5" for k, name in enumerate("abc" * 7)]
+    expr = terms[-1]
+    for term in reversed(terms[:-1]):
+        expr = f"{term} - ({expr})"
+    src = f"def spill(a, b, c):\n    return {expr}\n"
+    gen = generate_asm_source(src, fma=False)
+    spill = load_machine_code(assemble(gen.source()), gen.arg_kinds)
+    args = {"a": 1.5, "b": -2.25, "c": 0.75}
+    assert spill(*args.values()) == pytest.approx(eval(expr, {}, args))